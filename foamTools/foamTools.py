@@ -1,3 +1,8 @@
+import os
+import stat
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
 import numpy as np
 
 def loadVector(fPath):
@@ -93,3 +98,114 @@ def writeScalar(fPath, tPath, ss):
                 fWrite.write('{:e}\n'.format(ss[i]))
             fWrite.write(')\n')
             fWrite.write(';\n')
+
+def _splitTemplate(tPath):
+    '''
+    Split an openFOAM template file around its internalField entry
+    tPath  - template file path
+    header - template text up to and including the internalField line
+    footer - template text after the internalField line
+    '''
+    with open(tPath, 'r') as fTemplate:
+        f = fTemplate.readlines()
+
+    for num, line in enumerate(f):
+        if line.partition(' ')[0] == 'internalField':
+            dataLine = num
+            break
+    else:
+        raise ValueError('no internalField entry in template {}'.format(tPath))
+
+    header = ''.join(f[:dataLine+1])
+    footer = ''.join(f[dataLine+1:])
+
+    return header, footer
+
+def _fsyncDir(dPath):
+    '''
+    Flush a directory entry to disk so a preceding rename survives a crash,
+    no-op on platforms that cannot open directories
+    '''
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(dPath, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _writeScalarAtomic(fPath, header, footer, ss, mode):
+    '''
+    Write scalar internal field between header and footer into fPath through a
+    temporary file in the same directory, fsync it, then rename it over fPath.
+    The file gets the mode of the replaced fPath if it exists, otherwise mode
+    '''
+    N    = len(ss)
+    body = ''.join(['{:e}\n'.format(s) for s in ss])
+
+    dPath = os.path.dirname(os.path.abspath(fPath))
+    if os.path.exists(fPath):
+        mode = stat.S_IMODE(os.stat(fPath).st_mode)
+
+    fd, tmpPath = tempfile.mkstemp(dir=dPath,
+                                   prefix='.'+os.path.basename(fPath)+'.')
+    try:
+        os.chmod(tmpPath, mode)
+        with os.fdopen(fd, 'w') as fWrite:
+            fWrite.write(header)
+            fWrite.write('{}\n(\n'.format(N))
+            fWrite.write(body)
+            fWrite.write(')\n;\n')
+            fWrite.write(footer)
+            fWrite.flush()
+            os.fsync(fWrite.fileno())
+        os.replace(tmpPath, fPath)
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+
+    _fsyncDir(dPath)
+
+def writeScalarSeries(tDirs, fName, tPath, ss, nWorkers=4, maxInFlight=None):
+    '''
+    Write a time series of scalar internal fields into openFOAM format files
+    using tPath template, one file per time directory
+    tDirs       - list of time directory paths
+    fName       - field file name written in each time directory
+    tPath       - template file path, parsed once for all time directories
+    ss          - stacked scalar fields, shape (n_times, n_cells)
+    nWorkers    - number of writer processes
+    maxInFlight - maximum number of files being formatted or written at once,
+                  bounds memory held by pending writes (default 2*nWorkers)
+    Each file is written to a temporary file, fsynced and renamed into place,
+    so neither an interrupted run nor an OS crash leaves a partial field behind.
+    New files follow the process umask like writeScalar, replaced files keep
+    their existing mode
+    '''
+    ss = np.asarray(ss)
+    if ss.ndim != 2 or ss.shape[0] != len(tDirs):
+        raise ValueError('ss must have shape (len(tDirs), n_cells), got {}'
+                         .format(ss.shape))
+
+    if maxInFlight is None:
+        maxInFlight = 2*nWorkers
+
+    header, footer = _splitTemplate(tPath)
+
+    umask = os.umask(0)
+    os.umask(umask)
+    mode  = 0o666 & ~umask
+
+    with ProcessPoolExecutor(max_workers=nWorkers) as pool:
+        pending = set()
+        for tDir, s in zip(tDirs, ss):
+            if len(pending) >= maxInFlight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    fut.result()
+            pending.add(pool.submit(_writeScalarAtomic,
+                                    os.path.join(tDir, fName),
+                                    header, footer, s, mode))
+        for fut in pending:
+            fut.result()